@@ -21,24 +21,27 @@ class AbsorptionColumn:
         self.gas_inflow = gas_inflow
         
 
+    @staticmethod
     def calculate_henry_constant(T, standard_henry_constant, henry_temperature_dependence):
 
         """
-        Calculate the henry constant for a given temperature
+        Calculate the henry constant for a given temperature or an array of temperatures
 
         Parameters:
-            T (float) : Temperature in Kelvin
+            T (float or array) : Temperature in Kelvin
             standard_henry_constant (float) : Standard henry constant
             henry_temperature_dependence (float) : Temperature dependence of the henry constant
 
         Returns:
-            henry_constant (float) : Henry constant at the given temperature
+            henry_constant (float or array) : Henry constant at the given temperature
         """
 
-        # Calculate the henry constant for a given temperature 
+        # Calculate the henry constant for a given temperature, temperature sweeps are evaluated in one vectorised call
+        T = np.asarray(T, dtype=np.float64)
         henry_constant = standard_henry_constant * np.exp(henry_temperature_dependence * (1 / T - 1 / 298.15))
         return henry_constant
 
+    @staticmethod
     def calculate_minimum_solvent_flow(henry_constant, gas_inlet_concentration, gas_outlet_threshold_concentration, 
                                        liquid_inlet_concentration, molecular_weight_gas, gas_inflow, P):
         """
@@ -46,7 +49,7 @@ class AbsorptionColumn:
         that the liquid is saturated at the bottom of the column
 
         Parameters:
-            henry_constant (float) : Henry constant at the given temperature
+            henry_constant (float or array) : Henry constant at the given temperature
             gas_inlet_concentration (float) : Concentration of gas in the inlet stream
             gas_outlet_threshold_concentration (float) : Concentration of gas in the outlet stream
             liquid_inlet_concentration (float) : Concentration of gas in the inlet stream
@@ -55,7 +58,7 @@ class AbsorptionColumn:
             P (float) : Pressure in Pascals
 
         Returns:
-            minimum_solvent_flow (float) : Minimum solvent flow required to reach the target outlet concentration
+            minimum_solvent_flow (float or array) : Minimum solvent flow required to reach the target outlet concentration
         """
         # Calculate the saturated liquid outlet concentration using Henry's law 
         liquid_maximum_outlet_concentration = P * henry_constant * molecular_weight_gas * 1000
@@ -69,6 +72,7 @@ class AbsorptionColumn:
                                            / (gas_inlet_concentration / K - liquid_inlet_concentration))
         return minimum_solvent_flow
     
+    @staticmethod
     def calculate_molar_ratio(molar_fraction):
         """
         Calculate the molar ratio of a given molar fraction
@@ -1,6 +1,154 @@
+from functools import lru_cache
+
 import numpy as np
 import matplotlib.pyplot as plt
-import scipy.optimize as sp
+
+# Liquid molar fractions on which the lines of the McCabe-Thiele diagram are drawn, shared by all calls
+_XY_GRID = np.linspace(0.0, 1.0, 100)
+_XY_GRID.flags.writeable = False
+
+
+def _antoine_relative_volatility(antoine, T):
+    """Relative volatility of the most to the least volatile component from the Antoine equation, T may be an array"""
+    antoine = np.asarray(antoine, dtype=np.float64)
+    T = np.asarray(T, dtype=np.float64)[..., np.newaxis]
+    P_vap = np.power(10.0, antoine[:, 0] - antoine[:, 1]/(T + antoine[:, 2]))
+    alpha = P_vap.max(axis=-1)/P_vap.min(axis=-1)
+    return alpha if np.ndim(alpha) else alpha.item()
+
+
+@lru_cache(maxsize=1024)
+def _relative_volatility(antoine, T):
+    """Cached _antoine_relative_volatility, antoine must be a hashable tuple of tuples"""
+    return _antoine_relative_volatility(antoine, T)
+
+
+@lru_cache(maxsize=1024)
+def _equilibrium_curve(alpha):
+    """Cached equilibrium line of a binary mixture on _XY_GRID, returned read-only"""
+    # alpha*x/(1+(alpha-1)*x) evaluated in place in a single output buffer
+    equilibrium_line = np.multiply(alpha-1, _XY_GRID)
+    equilibrium_line += 1
+    np.divide(_XY_GRID, equilibrium_line, out=equilibrium_line)
+    equilibrium_line *= alpha
+    equilibrium_line.flags.writeable = False
+    return equilibrium_line
+
+
+def _q_line_intersection(alpha, q, xf):
+    """Liquid composition at the intersection of the q line and the equilibrium line, for floats or arrays
+
+    The q line is written as q*x + (1-q)*y = xf, which holds for every feed quality including the vertical
+    line of q = 1. Substituting the equilibrium line gives a quadratic which for 0 < xf < 1 has exactly one root
+    in [0, 1] as f(0) = -xf < 0 and f(1) = 1 - xf > 0, for xf = 0 or xf = 1 there can be two. The root is taken
+    from the cancellation free form of the quadratic formula, which also covers the linear case q = 0, and
+    polished with one Newton step using the analytic derivative. Should rounding push the root out of [0, 1],
+    e.g. for nearly azeotropic mixtures, it is solved with brentq, or set to NaN if [0, 1] holds no sign change.
+    """
+    alpha, q, xf = np.broadcast_arrays(*(np.asarray(i, dtype=np.float64) for i in (alpha, q, xf)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a2 = q*(alpha-1)
+        a1 = q + (1-q)*alpha - xf*(alpha-1)
+        a0 = -xf
+        t = -0.5*(a1 + np.copysign(np.sqrt(a1**2 - 4*a2*a0), a1))
+        root_0, root_1 = t/a2, a0/t
+        x = np.where((root_1 >= 0) & (root_1 <= 1), root_1, root_0)
+
+        # Newton step on f(x) = q*x + (1-q)*alpha*x/(1+(alpha-1)*x) - xf
+        f = q*x + (1-q)*alpha*x/(1+(alpha-1)*x) - xf
+        df = q + (1-q)*alpha/(1+(alpha-1)*x)**2
+        x = np.asarray(x - f/df)
+
+    outside = np.argwhere(~((x >= 0) & (x <= 1)))
+    if len(outside):
+        # scipy is only imported when the fallback is needed, as importing it dominates the start up time
+        import scipy.optimize as sp
+        for i in map(tuple, outside):
+            f = lambda x: q[i]*x + (1-q[i])*alpha[i]*x/(1+(alpha[i]-1)*x) - xf[i]
+            x[i] = sp.brentq(f, 0, 1, xtol=1e-12) if f(0)*f(1) <= 0 else np.nan
+    return x if np.ndim(x) else x.item()
+
+
+@lru_cache(maxsize=1024)
+def _cached_q_line_intersection(alpha, q, xf):
+    """Cached _q_line_intersection for single designs, reruns which only change the reflux factor reuse it"""
+    return _q_line_intersection(alpha, q, xf)
+
+
+def _q_line_rectifying_intersection(q, xf, xd, reflux_ratio):
+    """Liquid composition at the intersection of the q line q*x + (1-q)*y = xf and the rectifying line"""
+    return (xf - (1-q)*xd/(1+reflux_ratio))/(q + (1-q)*reflux_ratio/(1+reflux_ratio))
+
+
+def _step_stages(alpha, xb, xd, reflux_ratio, stripping_slope, b, y_upper, max_stages=1000):
+    """Steps off the McCabe-Thiele stages from xb up to xd, returns the seesaw points and the number of stages
+
+    The liquid composition leaving each stage follows from the composition of the stage below it:
+    the vapor in equilibrium with the liquid is brought back to the operating line of the section.
+    """
+
+    # The algorithm starts in the stripping section at the bottom composition,
+    # the stage compositions are written into preallocated arrays
+    x_stages = np.empty(max_stages + 1)
+    y_stages = np.empty(max_stages + 1)
+    stripping_condition = True
+    x_start = xb
+
+    for stage in range(max_stages + 1):
+        # Save the VLE point
+        vle_point = alpha*x_start/(1+(alpha-1)*x_start)
+        x_stages[stage] = x_start
+        y_stages[stage] = vle_point
+
+        if stripping_condition:
+            # Switch to the rectifying section once the VLE point is above the operating lines intersection
+            if vle_point > y_upper:
+                stripping_condition = False
+                x_start = ((1+reflux_ratio)*vle_point - xd)/reflux_ratio
+            else:
+                x_start = (vle_point-b)/stripping_slope
+        else:
+            # Stop once the distillate composition is reached
+            if vle_point > xd:
+                break
+            x_start = ((1+reflux_ratio)*vle_point - xd)/reflux_ratio
+
+        # The stages stop progressing when an operating line is pinched against the equilibrium line
+        if x_start - x_stages[stage] < 1e-12:
+            raise ValueError('Operating line pinched against the equilibrium line, increase the "reflux_factor"')
+    else:
+        # Slowly converging pinches are told apart from tall columns by the operating line of the current section
+        # crossing the equilibrium line, slope*x + intercept = alpha*x/(1+(alpha-1)*x), before the end of the section
+        if stripping_condition:
+            slope, intercept, x_end = stripping_slope, b, (y_upper-b)/stripping_slope
+        else:
+            slope, intercept, x_end = reflux_ratio/(1+reflux_ratio), xd/(1+reflux_ratio), xd
+        crossings = np.roots([slope*(alpha-1), slope + intercept*(alpha-1) - alpha, intercept])
+        crossings = crossings[np.isreal(crossings)].real
+        if np.any((crossings >= x_start) & (crossings <= x_end)):
+            raise ValueError('Operating line pinched against the equilibrium line, increase the "reflux_factor"')
+        raise ValueError(f'Distillate composition not reached within {max_stages} stages, increase "max_stages"')
+
+    # Truncate the stages at the stage which reaches the distillate composition
+    x_stages = x_stages[:stage + 1]
+    y_stages = y_stages[:stage + 1]
+
+    # The last stage is cut off at the distillate composition
+    y_stages[-1] = xd
+
+    # Make the seesaw points between the operating lines and the equilibrium line as a staircase,
+    # every stage is drawn up to its VLE point and across to the next stage starting from (xb, xb)
+    seesaw_points_x = np.empty(2*stage + 3)
+    seesaw_points_y = np.empty(2*stage + 3)
+    seesaw_points_x[:-1] = np.repeat(x_stages, 2)
+    seesaw_points_x[-1] = xd
+    seesaw_points_y[0] = xb
+    seesaw_points_y[1:] = np.repeat(y_stages, 2)
+
+    # Calculate the number of stages
+    number_of_stages = (len(seesaw_points_x)-1)/2 - 1
+    return seesaw_points_x, seesaw_points_y, number_of_stages
+
 
 class Ideal_Distillation:
 
@@ -31,7 +179,25 @@ class Ideal_Distillation:
         self.q = q
         self.R_fac = R_fac
 
-    def plot_mccabe_thiele(antoine, T, xd, xb, xf, q, reflux_factor):
+    @staticmethod
+    def calculate_relative_volatility(antoine, T):
+        """Calculates the relative volatility of the binary mixture from the Antoine equation
+
+        Keyword arguments:
+            antoine: [[a, b, c], [a, b, c]] : Antoine coefficients of the binary mixture
+            T: float : Temperature at which the distillation is done in Kelvin
+
+        Returns:
+            alpha: float : Relative volatility of the binary mixture
+        """
+
+        # The relative volatility only depends on the coefficients and the temperature,
+        # so repeated calls are served from the cache
+        antoine = tuple(tuple(float(i) for i in coefficients) for coefficients in antoine)
+        return _relative_volatility(antoine, float(T))
+
+    @staticmethod
+    def plot_mccabe_thiele(alpha, T, xd, xb, xf, q, reflux_factor, plot=True, max_stages=1000):
         """Plots the McCabe-Thiele diagram
         
         Keyword arguments:
@@ -39,9 +205,11 @@ class Ideal_Distillation:
             xd: float : Distillate molar fraction of the most volatile component
             xb: float : Bottom molar fraction of the most volatile component
             xf: float : Feed composition of the most volatile component
-            alpha: float : Relative volatility of the binary mixture
+            alpha: float : Relative volatility of the binary mixture, see calculate_relative_volatility
             q: float : Quality of the feed
             reflux_factor: float : Factor which is multiplied with the minimum reflux ratio
+            plot: bool : Whether to draw the diagram, pass False to only calculate the design in sweeps
+            max_stages: int : Maximum number of stages which are stepped off
 
         Returns:
             Plot of the McCabe-Thiele diagram for the given binary mixture with given input parameters
@@ -52,138 +220,154 @@ class Ideal_Distillation:
         # Check input parameters
         if xb > 1 or xb < 0 or xf > 1 or xf < 0 or xd > 1 or xd < 0 or q > 1.5 or q < -0.5:
             raise ValueError("Input parameters must be between 0 and 1")
+        if xd == 1 or xb == 0:
+            raise ValueError('Infeasible "xd" or "xb" parameter, a pure distillate or bottom product requires infinitely many stages')
+        if alpha <= 1:
+            raise ValueError('Infeasible "alpha" parameter, the relative volatility must be larger than 1 for a separation')
+
+        # Check if xd is above the intersection between the q_line and the equilibrium line before solving for it,
+        # the intersection lies above xd when the equilibrium point at y = xd is below the q line q*x + (1-q)*y = xf
+        x_equilibrium_xd = xd/(alpha - (alpha-1)*xd)
+        if q*x_equilibrium_xd + (1-q)*xd < xf:
+            raise ValueError('Infeasible "xd" parameter, the vapor fraction cannot decrease while the liquid molar fraction is increasing')
 
-        # Calculate the vapor pressures
-        P_vap = [10 **(i[0] - i[1] / (T + i[2])) for i in antoine]
-    
-        # Calculate the relative volatility
-        alpha = max(P_vap)/min(P_vap)
-
-        # Create xy line and equilibrium line
-        x = np.linspace(0,1,100)
-        y = np.linspace(0,1,100)
-        equilibrium_line = alpha*x/(1+(alpha-1)*x)
-
-        # Plotting the xy line and the equilibrium line
-        plt.plot(x, y, color='black')
-        plt.plot(x, equilibrium_line, color='black')
-        plt.xlabel('x')
-        plt.ylabel('y')
-        plt.title('McCabe-Thiele diagram')
-        plt.axis([0, 1, 0, 1])
-
-        # Plot the q line 
-        if q == 1:
-            x_values_q_line = xf*np.ones(len(y)) 
-            plt.plot(x_values_q_line, y, label='q line')
-        else:
-            q_line = -q/(1-q)*x + xf/(1-q)
-            plt.plot(x, q_line, label='q line')
-        
         # Calculate the intersection point between the q line and the equilibrium line
-        if q == 1: 
-            intersection_q_and_VLE = xf
-        else:
-            intersection_q_and_VLE = sp.fsolve(lambda x: alpha*x/(1+(alpha-1)*x) - (-q/(1-q)*x + xf/(1-q)), xf)
-            # Convert numpy array from fsolve to a float
-            intersection_q_and_VLE = intersection_q_and_VLE.item(0)
-
-        # Check if xd is above the intersection between the q_line and the equilibrium line
-        intersection_y = alpha*intersection_q_and_VLE/(1+(alpha-1)*intersection_q_and_VLE)
-        if intersection_y > xd:
-            raise ValueError('Infeasible "xd" parameter, the vapor fraction cannot decrease while the liquid molar fraction is increasing')
+        intersection_q_and_VLE = _cached_q_line_intersection(float(alpha), float(q), float(xf))
+        if not 0 < intersection_q_and_VLE < 1:
+            raise ValueError('Infeasible "xf" or "q" parameter, the q line does not intersect the equilibrium line within (0, 1)')
 
         # Calculate the maximum reflux ratio
         minimum_reflux = (xd/intersection_q_and_VLE-alpha*((1-xd)/(1-intersection_q_and_VLE)))/(alpha-1)
 
         # Set the reflux ratio
         reflux_ratio = minimum_reflux*reflux_factor
-        
-        # Plot the rectifying line
-        rectifying_line = (reflux_ratio / (1+reflux_ratio)) * x + ( 1/(1 + reflux_ratio)) * xd
-        plt.plot(x, rectifying_line, label='Rectifying')
 
-        # Plot the stripping line
-        if q == 1: 
-            x_upper = xf
-        else:
-            x_upper = sp.fsolve(lambda x: (reflux_ratio/(1+reflux_ratio))*x+(1/(1+reflux_ratio))*xd - (-q/(1-q)*x + xf/(1-q)), xf)
-            if x_upper < xb:
-                raise ValueError('Infeasible "q" or "xb" parameter, with given parameters the stripping section is not possible or useless')
+        # Calculate the stripping line from the intersection of the rectifying line and the q line
+        x_upper = _q_line_rectifying_intersection(q, xf, xd, reflux_ratio)
+        if x_upper < xb:
+            raise ValueError('Infeasible "q" or "xb" parameter, with given parameters the stripping section is not possible or useless')
 
         y_upper = (reflux_ratio/(1+reflux_ratio))*x_upper+(1/(1+reflux_ratio))*xd
         stripping_slope = (y_upper-xb)/(x_upper-xb)
         b = xb - stripping_slope*xb
-        y_stripping = stripping_slope*x + b
-        plt.plot(x, y_stripping, label='Stripping')
-
-        # Drawing the stages
-        # First we set the conditions for when the seesaw is in the stripping or rectifying section
-        # Condition is True when the drawing algorithm is in the corresponding section
-        # The algorithm starts in the stripping section:
-        stripping_condition, rectifying_condition = True, False
+
+        # Step off the stages between the operating lines and the equilibrium line
+        seesaw_points_x, seesaw_points_y, number_of_stages = _step_stages(alpha, xb, xd, reflux_ratio,
+                                                                          stripping_slope, b, y_upper, max_stages)
+
+        if plot:
+            # Plotting the xy line and the equilibrium line
+            x = y = _XY_GRID
+            plt.plot(x, y, color='black')
+            plt.plot(x, _equilibrium_curve(alpha), color='black')
+            plt.xlabel('x')
+            plt.ylabel('y')
+            plt.title('McCabe-Thiele diagram')
+            plt.axis([0, 1, 0, 1])
+
+            # Plot the q line q*x + (1-q)*y = xf through (xf, xf), long enough to cross the whole diagram
+            plt.plot([xf + 2*(1-q), xf - 2*(1-q)], [xf - 2*q, xf + 2*q], label='q line')
+
+            # Plot the rectifying and stripping line
+            plt.plot(x, (reflux_ratio / (1+reflux_ratio)) * x + ( 1/(1 + reflux_ratio)) * xd, label='Rectifying')
+            plt.plot(x, stripping_slope*x + b, label='Stripping')
+
+            # Plot the stages calculated
+            plt.plot(seesaw_points_x, seesaw_points_y)
+            plt.show()
+
+        return number_of_stages, reflux_ratio
+
+    @staticmethod
+    def calculate_mccabe_thiele_batch(antoine, T, xd, xb, xf, q, reflux_factor, max_stages=1000):
+        """Calculates the McCabe-Thiele design for a batch of input parameters without plotting
         
-        # Make an array in which the points can be stored
-        seesaw_points_x = [np.array([xb])]
-        seesaw_points_y = [np.array([xb])]
+        All input parameters except the Antoine coefficients may be given as arrays, which are broadcast
+        against each other. Designs which are infeasible or do not reach the distillate composition within
+        max_stages get NaN as their number of stages, infeasible designs also get NaN as their reflux ratio.
 
-        # Set initial starting point
-        x_start, y_start = np.array([xb]), np.array([xb])
+        Keyword arguments:
+            antoine: [[a, b, c], [a, b, c]] : Antoine coefficients of the binary mixture
+            T: array : Temperatures at which the distillation is done in Kelvin
+            xd: array : Distillate molar fractions of the most volatile component
+            xb: array : Bottom molar fractions of the most volatile component
+            xf: array : Feed compositions of the most volatile component
+            q: array : Qualities of the feed
+            reflux_factor: array : Factors which are multiplied with the minimum reflux ratio
+            max_stages: int : Maximum number of stages which are stepped off
 
-        # Draw the seesaw between the operating lines and the equilibrium line
-        while stripping_condition:
-            # Save the VLE point
-            seesaw_points_x.append(x_start)
-            vle_point = alpha*x_start/(1+(alpha-1)*x_start)
-            seesaw_points_y.append(vle_point)
+        Returns:
+            number_of_stages: array : Number of stages of every design, NaN if infeasible or not converged
+            reflux_ratio: array : Reflux ratio of every design, NaN if infeasible
+        """
+
+        T, xd, xb, xf, q, reflux_factor = np.broadcast_arrays(*(np.atleast_1d(np.asarray(i, dtype=np.float64))
+                                                                for i in (T, xd, xb, xf, q, reflux_factor)))
+
+        # Check input parameters
+        if np.any((xb > 1) | (xb < 0) | (xf > 1) | (xf < 0) | (xd > 1) | (xd < 0) | (q > 1.5) | (q < -0.5)):
+            raise ValueError("Input parameters must be between 0 and 1")
+
+        # Calculate the relative volatility of every design
+        alpha = _antoine_relative_volatility(antoine, T)
+
+        # Designs are infeasible if a pure product is asked, which requires infinitely many stages, if the mixture
+        # cannot be separated or if xd is below the q line intersection, which is the case when the equilibrium
+        # point at y = xd is below the q line q*x + (1-q)*y = xf
+        x_equilibrium_xd = xd/(alpha - (alpha-1)*xd)
+        active = (xd < 1) & (xb > 0) & (alpha > 1) & ~(q*x_equilibrium_xd + (1-q)*xd < xf)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Calculate the intersection point between the q line and the equilibrium line
+            intersection_q_and_VLE = _q_line_intersection(alpha, q, xf)
+
+            # Calculate the minimum and actual reflux ratio
+            minimum_reflux = (xd/intersection_q_and_VLE-alpha*((1-xd)/(1-intersection_q_and_VLE)))/(alpha-1)
+            reflux_ratio = minimum_reflux*reflux_factor
+
+            # Calculate the intersection between the rectifying line and the q line and the stripping line
+            x_upper = _q_line_rectifying_intersection(q, xf, xd, reflux_ratio)
+            y_upper = (reflux_ratio/(1+reflux_ratio))*x_upper+(1/(1+reflux_ratio))*xd
+            stripping_slope = (y_upper-xb)/(x_upper-xb)
+            b = xb - stripping_slope*xb
+
+        # Designs are also infeasible if the q line does not intersect the equilibrium line within (0, 1)
+        # or the stripping section is not possible
+        active &= (intersection_q_and_VLE > 0) & (intersection_q_and_VLE < 1) & ~(x_upper < xb)
+        reflux_ratio = np.where(active, reflux_ratio, np.nan)
+
+        # Step off the stages of all designs simultaneously, converged designs are frozen by the active mask
+        number_of_stages = np.full(T.shape, np.nan)
+        stripping_condition = np.ones(T.shape, dtype=bool)
+        x_start = xb.copy()
+        vle_point = np.empty(T.shape)
+        alpha_minus_one = alpha - 1
+
+        for stage in range(max_stages + 1):
+            # alpha*x/(1+(alpha-1)*x) evaluated in place in the preallocated buffer
+            np.multiply(alpha_minus_one, x_start, out=vle_point)
+            vle_point += 1
+            np.divide(x_start, vle_point, out=vle_point)
+            vle_point *= alpha
+
+            # Stop the designs in the rectifying section which reached the distillate composition
+            finished = active & ~stripping_condition & (vle_point > xd)
+            number_of_stages[finished] = stage
+            active &= ~finished
+            if not active.any():
+                break
+
+            # Switch to the rectifying section once the VLE point is above the operating lines intersection
+            stripping_condition &= ~(vle_point > y_upper)
+
+            # Calculate the new starting points on the operating lines of the active designs
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.divide(vle_point-b, stripping_slope, out=x_start, where=active & stripping_condition)
+                np.divide((1+reflux_ratio)*vle_point - xd, reflux_ratio, out=x_start, where=active & ~stripping_condition)
 
-            # Check VLE conditional
-            if vle_point > y_upper:
-                stripping_condition = False
-                rectifying_condition = True
-                x_start = sp.fsolve(lambda x: (reflux_ratio/(1+reflux_ratio))*x+(1/(1+reflux_ratio))*xd - vle_point, x0=xf)
-                y_start = vle_point
-                seesaw_points_x.append(x_start)
-                seesaw_points_y.append(y_start)
-                break 
-
-            # Calculate the new starting point on the stripping section
-            x_start = (vle_point-b)/stripping_slope
-            y_start = stripping_slope*x_start + b
-            seesaw_points_x.append(x_start)
-            seesaw_points_y.append(y_start)
-
-        while rectifying_condition:
-            # Save the VLE point
-            seesaw_points_x.append(x_start)
-            vle_point = alpha*x_start/(1+(alpha-1)*x_start)
-            seesaw_points_y.append(vle_point)
-
-            # Check VLE conditional
-            if vle_point > xd:
-                rectifying_condition = False
-                seesaw_points_y.pop(-1)
-                seesaw_points_y.append(np.array([xd]))
-                # Add last point
-                seesaw_points_y.append(np.array([xd]))
-                seesaw_points_x.append(np.array([xd]))
-                break 
-            
-            # Calculate the new starting point on the rectifying section
-            a = reflux_ratio/(1+reflux_ratio)
-            b = (1/(1+reflux_ratio))*xd
-            x_start = sp.fsolve(lambda x: a*x+b - vle_point, vle_point)
-            seesaw_points_x.append(x_start)
-            seesaw_points_y.append(vle_point)
-
-        # Calculate the number of stages
-        number_of_stages = (len(seesaw_points_x)-1)/2 - 1
-
-        # Plot the stages calculated
-        plt.plot(seesaw_points_x, seesaw_points_y)
-        plt.show()
         return number_of_stages, reflux_ratio
 
+    @staticmethod
     def show_design_summary(reflux_ratio, T, xb, xf, xd, number_of_stages):
         
         """
@@ -249,5 +433,6 @@ q = 0.5
 reflux_factor = 1.5
 
 # Run the script
-number_of_stages, reflux_ratio = Ideal_Distillation.plot_mccabe_thiele(antoine, T, xd, xb, xf, q, reflux_factor)
+alpha = Ideal_Distillation.calculate_relative_volatility(antoine, T)
+number_of_stages, reflux_ratio = Ideal_Distillation.plot_mccabe_thiele(alpha, T, xd, xb, xf, q, reflux_factor)
 Ideal_Distillation.show_design_summary(reflux_ratio, T, xb, xf, xd, number_of_stages)